@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
 import { API_BASE_URL } from '../config';
+import { waitForJob } from '../jobs';
 import '../styles/components/RecordingPage.css';
 
 const RecordingPage = () => {
@@ -112,8 +113,11 @@ const RecordingPage = () => {
       
       const data = await response.json();
       
+      // Processing runs in the background; wait for the transcript
+      const job = await waitForJob(data.job_id, user.token);
+      
       // Navigate to the transcript page
-      navigate(`/transcript/${data.transcript_id}`);
+      navigate(`/transcript/${job.transcript_id}`);
       
     } catch (err) {
       setError(err.message);
@@ -2,6 +2,7 @@ import React, { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
 import { API_BASE_URL } from '../config';
+import { waitForJob } from '../jobs';
 import '../styles/components/UploadPage.css';
 
 const UploadPage = () => {
@@ -68,13 +69,16 @@ const UploadPage = () => {
         throw new Error(errorData.detail || 'Upload failed');
       }
       
-      setProgress(100);
-      
       const data = await response.json();
       
+      // Processing runs in the background; wait for the transcript
+      const job = await waitForJob(data.job_id, user.token);
+      
+      setProgress(100);
+      
       // Navigate to the transcript page
       setTimeout(() => {
-        navigate(`/transcript/${data.transcript_id}`);
+        navigate(`/transcript/${job.transcript_id}`);
       }, 1000);
       
     } catch (err) {
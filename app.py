@@ -1,26 +1,34 @@
 import os
 import time
+import asyncio
 import uuid
-import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, BackgroundTasks, UploadFile, File, Form, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 import jwt
 from jwt.exceptions import InvalidTokenError
+import aiofiles
+import orjson
+from cachetools import TTLCache
 
 from transcription_service import CourtTranscriptionService
 from diarization_service import DiarizationService
 from noise_suppression import NoiseSuppression
 from storage_service import StorageService
-from utils import create_logger, generate_timestamp
+from utils import create_logger, generate_timestamp, kernel_version_at_least
 
 # Initialize FastAPI
 app = FastAPI(title="Court Transcription System API", 
-              description="API for AI-powered courtroom transcription with speaker diarization")
+              description="API for AI-powered courtroom transcription with speaker diarization",
+              default_response_class=ORJSONResponse)
 
 # CORS configuration
 app.add_middleware(
@@ -42,11 +50,30 @@ transcription_service = CourtTranscriptionService(
     storage_service
 )
 
+# All jobs share one set of models, and neither whisper's decoder nor the
+# Numba noise kernel is safe to run concurrently, so jobs queue up on a
+# single worker thread instead of racing
+pipeline_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline")
+
 # Authentication configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-for-development")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# Uploads are written to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Verified tokens are cached briefly so repeat requests skip jwt.decode
+TOKEN_CACHE_TTL_SECONDS = 10
+TOKEN_CACHE_MAX_SIZE = 10_000
+
+# Processing job states are kept for a day for status polling
+JOB_STATUS_TTL_SECONDS = 24 * 60 * 60
+JOB_STATUS_MAX_SIZE = 10_000
+
+# WebSocket broadcasts are sent concurrently in batches of this size
+BROADCAST_BATCH_SIZE = 50
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # User roles (simplified for demonstration)
@@ -120,16 +147,44 @@ class WebSocketManager:
         self.active_connections[client_id].append(websocket)
         
     def disconnect(self, websocket: WebSocket, client_id: str):
-        if client_id in self.active_connections:
-            self.active_connections[client_id].remove(websocket)
+        connections = self.active_connections.get(client_id)
+        if connections and websocket in connections:
+            connections.remove(websocket)
             
     async def broadcast(self, client_id: str, message: dict):
-        if client_id in self.active_connections:
-            for connection in self.active_connections[client_id]:
-                await connection.send_json(message)
+        connections = list(self.active_connections.get(client_id, []))
+        if not connections:
+            return
+        
+        # Serialize once for every subscriber; the viewer parses text frames
+        payload = orjson.dumps(message).decode()
+        
+        dead_connections = []
+        for i in range(0, len(connections), BROADCAST_BATCH_SIZE):
+            batch = connections[i:i + BROADCAST_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(connection.send_text(payload) for connection in batch),
+                return_exceptions=True
+            )
+            dead_connections.extend(
+                connection for connection, result in zip(batch, results)
+                if isinstance(result, Exception)
+            )
+            # Yield to the event loop between batches at high fanout
+            await asyncio.sleep(0)
+        
+        for connection in dead_connections:
+            self.disconnect(connection, client_id)
 
 websocket_manager = WebSocketManager()
 
+# sha256(token) -> (User, exp); only successful validations are cached
+token_cache = TTLCache(maxsize=TOKEN_CACHE_MAX_SIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+token_cache_lock = threading.Lock()
+
+# job_id -> {"status": queued | processing | completed | failed, ...}
+job_statuses = TTLCache(maxsize=JOB_STATUS_MAX_SIZE, ttl=JOB_STATUS_TTL_SECONDS)
+
 # Authentication functions
 def verify_password(plain_password, hashed_password):
     # In production, use proper password verification
@@ -169,6 +224,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    
+    cache_key = hashlib.sha256(token.encode()).digest()
+    with token_cache_lock:
+        cached = token_cache.get(cache_key)
+    if cached is not None:
+        cached_user, expires_at = cached
+        if expires_at > time.time():
+            return cached_user
+        with token_cache_lock:
+            token_cache.pop(cache_key, None)
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -180,6 +246,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     user = get_user(username=token_data.username)
     if user is None:
         raise credentials_exception
+    
+    if "exp" in payload:
+        with token_cache_lock:
+            token_cache[cache_key] = (user, payload["exp"])
     return user
 
 def has_permission(user: User, required_permission: str):
@@ -203,9 +273,87 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+# Upload helpers
+def _new_upload_location(filename: Optional[str]) -> str:
+    file_location = f"uploads/{uuid.uuid4()}{os.path.splitext(filename or '')[1]}"
+    os.makedirs(os.path.dirname(file_location), exist_ok=True)
+    return file_location
+
+async def _iter_upload_file(file: UploadFile):
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+async def _save_upload(chunks, file_location: str) -> str:
+    # Hash while writing so duplicate uploads can be detected without a second pass
+    content_hash = hashlib.sha256()
+    async with aiofiles.open(file_location, "wb") as file_object:
+        async for chunk in chunks:
+            if chunk:
+                content_hash.update(chunk)
+                await file_object.write(chunk)
+    return content_hash.hexdigest()
+
+def _queue_upload(
+    background_tasks: BackgroundTasks,
+    file_location: str,
+    case_id: Optional[str],
+    content_hash: str
+) -> dict:
+    job_id = str(uuid.uuid4())
+    
+    # Identical audio for the same case was already transcribed (e.g. a retried upload)
+    existing_id = storage_service.get_by_content_hash(content_hash, case_id)
+    if existing_id:
+        os.remove(file_location)
+        status = {
+            "status": "completed",
+            "message": "Audio was already processed",
+            "transcript_id": existing_id
+        }
+        job_statuses[job_id] = status
+        return {"job_id": job_id, **status}
+    
+    # Processing runs after the response is sent; clients poll the job or
+    # subscribe to /ws/{job_id} for progress
+    job_statuses[job_id] = {"status": "queued"}
+    background_tasks.add_task(_run_pipeline, file_location, case_id, content_hash, job_id)
+    
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "message": "Audio queued for processing"
+    }
+
+async def _update_job(job_id: str, status: dict):
+    job_statuses[job_id] = status
+    await websocket_manager.broadcast(job_id, {"action": "job_updated", "job_id": job_id, **status})
+
+async def _run_pipeline(
+    file_location: str, case_id: Optional[str], content_hash: str, job_id: str
+):
+    await _update_job(job_id, {"status": "processing"})
+    
+    try:
+        # The pipeline is CPU/GPU bound; keep it off the event loop
+        transcript = await asyncio.get_running_loop().run_in_executor(
+            pipeline_executor, transcription_service.process_audio, file_location, case_id, content_hash
+        )
+        await _update_job(job_id, {
+            "status": "completed",
+            "message": "Audio processed successfully",
+            "transcript_id": transcript["id"]
+        })
+    except Exception as e:
+        logger.error(f"Error processing audio: {str(e)}")
+        await _update_job(job_id, {
+            "status": "failed",
+            "message": f"Error processing audio: {str(e)}"
+        })
+
 # API routes for transcription
 @app.post("/api/upload-audio", response_model=dict)
 async def upload_audio(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     case_id: str = Form(None),
     user: User = Depends(get_current_user)
@@ -213,32 +361,47 @@ async def upload_audio(
     if not has_permission(user, "read"):
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    # Save uploaded file
-    file_location = f"uploads/{uuid.uuid4()}{os.path.splitext(file.filename)[1]}"
-    os.makedirs(os.path.dirname(file_location), exist_ok=True)
+    # Save uploaded file chunk by chunk instead of buffering it in memory
+    file_location = _new_upload_location(file.filename)
+    content_hash = await _save_upload(_iter_upload_file(file), file_location)
     
-    with open(file_location, "wb+") as file_object:
-        file_object.write(await file.read())
+    return _queue_upload(background_tasks, file_location, case_id, content_hash)
+
+@app.post("/api/upload-audio-stream", response_model=dict)
+async def upload_audio_stream(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    filename: str = "upload.wav",
+    case_id: Optional[str] = None,
+    user: User = Depends(get_current_user)
+):
+    """
+    Upload a large recording as the raw request body
     
-    # Process audio asynchronously (simplified for this example)
-    job_id = str(uuid.uuid4())
+    The body is streamed from the socket straight to disk, so memory use
+    stays constant regardless of the recording length.
+    """
+    if not has_permission(user, "read"):
+        raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    # In a real implementation, this would be a background task
-    # For simplicity, we process synchronously here
-    try:
-        transcript = transcription_service.process_audio(file_location, case_id)
-        return {
-            "job_id": job_id,
-            "status": "success",
-            "message": "Audio processed successfully",
-            "transcript_id": transcript["id"]
-        }
-    except Exception as e:
-        logger.error(f"Error processing audio: {str(e)}")
-        raise HTTPException(
-            status_code=500, 
-            detail=f"Error processing audio: {str(e)}"
-        )
+    file_location = _new_upload_location(filename)
+    content_hash = await _save_upload(request.stream(), file_location)
+    
+    return _queue_upload(background_tasks, file_location, case_id, content_hash)
+
+@app.get("/api/job/{job_id}", response_model=dict)
+async def get_job_status(
+    job_id: str,
+    user: User = Depends(get_current_user)
+):
+    if not has_permission(user, "read"):
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    
+    status = job_statuses.get(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {"job_id": job_id, **status}
 
 @app.get("/api/transcript/{transcript_id}", response_model=TranscriptResponse)
 async def get_transcript(
@@ -405,4 +568,21 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    
+    # "auto" lets uvicorn pick uvloop when it is installed
+    loop = "auto"
+    reload = True
+    
+    # On Linux 5.11+ prefer the io_uring-backed uringcore loop
+    if kernel_version_at_least(5, 11):
+        try:
+            import uringcore
+            asyncio.set_event_loop_policy(uringcore.EventLoopPolicy())
+            # Keep the installed policy; the reloader would start a fresh
+            # interpreter without it
+            loop = "none"
+            reload = False
+        except ImportError:
+            pass
+    
+    uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=reload, loop=loop)
\ No newline at end of file
@@ -0,0 +1,25 @@
+import { API_BASE_URL } from './config';
+
+const POLL_INTERVAL_MS = 2000;
+
+// Poll a processing job until it completes; resolves with the final job status
+export const waitForJob = async (jobId, token) => {
+  while (true) {
+    const response = await fetch(`${API_BASE_URL}/api/job/${jobId}`, {
+      headers: {
+        'Authorization': `Bearer ${token}`
+      }
+    });
+    
+    if (!response.ok) {
+      const errorData = await response.json();
+      throw new Error(errorData.detail || 'Failed to fetch job status');
+    }
+    
+    const job = await response.json();
+    if (job.status === 'completed') return job;
+    if (job.status === 'failed') throw new Error(job.message || 'Processing failed');
+    
+    await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+  }
+};
@@ -1,39 +1,125 @@
 import os
-import json
+import orjson
 import sqlite3
 import hashlib
 import tempfile
-from typing import Dict, List, Optional, Any
+import queue
+import threading
+import contextlib
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
+from urllib.request import pathname2url
 import uuid
+from cachetools import LRUCache
 from utils import create_logger
 
+# Number of read-only connections shared by concurrent readers; reads are
+# short, so a few connections cover the request concurrency of one process
+READ_POOL_SIZE = min(4, os.cpu_count() or 4)
+
+# Page cache per connection in KiB; readers share the OS page cache and
+# only need a small private one
+WRITE_CACHE_KIB = 64000
+READ_CACHE_KIB = 8000
+
+# Number of verified, parsed transcripts kept in memory
+TRANSCRIPT_CACHE_SIZE = 256
+
+# Segment keys with a column of their own; any other keys are kept as JSON
+SEGMENT_FIELDS = ("id", "speaker", "text", "start_time", "end_time", "confidence")
+
 class StorageService:
     def __init__(self, db_path: str = "transcripts.db"):
         self.logger = create_logger("storage_service")
         self.db_path = db_path
         
+        # Long-lived connections: writes are serialized on one read-write
+        # connection, reads borrow from a pool of read-only ones that WAL
+        # lets run alongside the writer and each other
+        self._conn = None
+        self._read_pool = None
+        self._lock = threading.Lock()
+        
+        # Whether SQLite was built with the JSON1 functions (built in since 3.38)
+        self.json1_available = False
+        
+        # Transcript ID -> (stored hash, parsed data) for recently verified reads
+        self._cache = LRUCache(maxsize=TRANSCRIPT_CACHE_SIZE)
+        self._cache_lock = threading.Lock()
+        
+        self._log_hash_backend()
+        
         # Initialize database
         self._init_db()
     
     def _init_db(self):
         """Initialize the database with required tables"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            self._conn = self._connect()
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # Planner statistics only need refreshing when indexes get created
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+            existing_indexes = {name for name, in cursor.fetchall()}
             
             # Create transcripts table
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS transcripts (
                 id TEXT PRIMARY KEY,
-                data TEXT NOT NULL,
+                data BLOB NOT NULL,
                 created_at TEXT NOT NULL,
                 updated_at TEXT NOT NULL,
                 case_id TEXT,
-                hash TEXT NOT NULL
+                hash BLOB NOT NULL,
+                content_hash TEXT,
+                segments_count INTEGER,
+                speakers_count INTEGER,
+                duration REAL
             )
             ''')
             
+            # Migrate databases created before these columns existed
+            self._add_column(cursor, "transcripts", "content_hash TEXT")
+            self._add_column(cursor, "transcripts", "segments_count INTEGER")
+            self._add_column(cursor, "transcripts", "speakers_count INTEGER")
+            self._add_column(cursor, "transcripts", "duration REAL")
+            
+            # Backfill the summary columns of rows stored before they existed
+            cursor.execute("SELECT id, data FROM transcripts WHERE segments_count IS NULL")
+            cursor.executemany(
+                "UPDATE transcripts SET segments_count = ?, speakers_count = ?, duration = ? WHERE id = ?",
+                [(*self._summarize(orjson.loads(data)), transcript_id) for transcript_id, data in cursor.fetchall()]
+            )
+            
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transcripts_content_hash ON transcripts(content_hash)"
+            )
+            
+            # Segments are stored one row each so an edit touches a single row
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS segments (
+                transcript_id TEXT NOT NULL,
+                segment_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                speaker TEXT,
+                text TEXT,
+                start_time REAL,
+                end_time REAL,
+                confidence REAL,
+                extra BLOB,
+                hash BLOB NOT NULL,
+                PRIMARY KEY (transcript_id, segment_id),
+                FOREIGN KEY (transcript_id) REFERENCES transcripts(id)
+            )
+            ''')
+            self._add_column(cursor, "segments", "extra BLOB")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_segments_position ON segments(transcript_id, position)"
+            )
+            
+            self._migrate_segments(cursor)
+            
             # Create audit log table
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS audit_log (
@@ -47,84 +133,388 @@ class StorageService:
             )
             ''')
             
-            conn.commit()
-            conn.close()
+            # Serve case filtering and newest-first paging from an index
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transcripts_case_created ON transcripts(case_id, created_at DESC)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_transcripts_created ON transcripts(created_at DESC)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_audit_transcript ON audit_log(transcript_id)"
+            )
+            
+            # Refresh planner statistics so the new indexes are picked up
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+            if {name for name, in cursor.fetchall()} - existing_indexes:
+                cursor.execute("ANALYZE")
+            
+            self._conn.commit()
+            
+            try:
+                cursor.execute("SELECT json_extract('{}', '$')")
+                self.json1_available = True
+            except sqlite3.OperationalError:
+                self.logger.warning("SQLite JSON1 functions not available, listings will parse full transcripts")
+            
+            # Read-only connections can only be opened once the file exists
+            read_pool = queue.Queue()
+            for _ in range(READ_POOL_SIZE):
+                read_pool.put(self._connect(read_only=True))
+            self._read_pool = read_pool
             self.logger.info("Database initialized successfully")
         
         except Exception as e:
+            if self._conn is not None and self._conn.in_transaction:
+                self._conn.rollback()
             self.logger.error(f"Error initializing database: {str(e)}")
     
-    def store_transcript(self, transcript_id: str, transcript_data: Dict) -> bool:
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """
+        Open a database connection with the performance pragmas applied
+        
+        Args:
+            read_only: Open the database in read-only mode
+        
+        Returns:
+            SQLite connection usable from any thread
+        """
+        if read_only:
+            uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+        else:
+            # Autocommit mode; transactions are opened explicitly
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            # WAL is a property of the database file, so set it from the writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            
+            # Lets segment edits re-hash the row inside the UPDATE statement
+            conn.create_function(
+                "segment_hash", 9,
+                lambda transcript_id, *values: self._segment_hash(transcript_id, values[:-1], values[-1]),
+                deterministic=True
+            )
+        
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA cache_size=-{READ_CACHE_KIB if read_only else WRITE_CACHE_KIB}")
+        return conn
+    
+    def _log_hash_backend(self):
+        """Log which SHA-256 implementation integrity checks run on"""
+        try:
+            openssl = hashlib.sha256.__name__.startswith("openssl_")
+            sha_ni = False
+            if os.path.exists("/proc/cpuinfo"):
+                with open("/proc/cpuinfo") as f:
+                    sha_ni = any("sha_ni" in line.split() for line in f if line.startswith("flags"))
+            
+            self.logger.info(
+                f"SHA-256 backend: {'OpenSSL' if openssl else 'builtin'}, "
+                f"CPU SHA extensions: {'yes' if sha_ni else 'no/unknown'}"
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not determine SHA-256 backend: {str(e)}")
+    
+    def _invalidate(self, transcript_id: str):
+        """Drop a transcript from the in-memory cache"""
+        with self._cache_lock:
+            self._cache.pop(transcript_id, None)
+    
+    def _hash_matches(self, json_data: bytes, stored_hash: Any) -> bool:
+        """Check data against its stored hash; older rows store a hex string"""
+        computed_hash = hashlib.sha256(json_data).digest()
+        if isinstance(stored_hash, str):
+            computed_hash = computed_hash.hex()
+        return computed_hash == stored_hash
+    
+    def _segment_hash(self, transcript_id: str, values: Tuple, extra: Optional[bytes] = None) -> bytes:
+        """Hash a segment row, including its transcript so rows cannot be moved between transcripts"""
+        segment_hash = hashlib.sha256(orjson.dumps([transcript_id, *values]))
+        # Rows without extra keys hash as they did before the column existed
+        if extra is not None:
+            segment_hash.update(extra)
+        return segment_hash.digest()
+    
+    def _segment_rows(self, transcript_id: str, segments: List[Dict]) -> List[Tuple]:
+        """
+        Build rows for the segments table
+        
+        Segments are keyed by their "id" within a transcript, so every
+        segment must carry one and no two may share it.
+        
+        Args:
+            transcript_id: The ID of the transcript the segments belong to
+            segments: Transcript segments in order
+            
+        Returns:
+            Row tuples ending with each row's extra keys and integrity hash
+            
+        Raises:
+            ValueError: If a segment has no id or repeats an earlier one
+        """
+        rows = []
+        seen_ids = set()
+        for position, segment in enumerate(segments):
+            segment_id = segment.get("id")
+            if segment_id is None:
+                raise ValueError(f"Segment {position} of transcript {transcript_id} has no id")
+            if segment_id in seen_ids:
+                raise ValueError(f"Duplicate segment id {segment_id} in transcript {transcript_id}")
+            seen_ids.add(segment_id)
+            
+            # Times and confidence are hashed as the REAL values they read back as
+            values = (
+                segment_id,
+                position,
+                segment.get("speaker"),
+                segment.get("text"),
+                *(
+                    None if segment.get(key) is None else float(segment[key])
+                    for key in ("start_time", "end_time", "confidence")
+                )
+            )
+            
+            # Keys without a column of their own, e.g. case_id, round-trip as JSON
+            extra = {key: value for key, value in segment.items() if key not in SEGMENT_FIELDS}
+            extra = orjson.dumps(extra) if extra else None
+            
+            rows.append((transcript_id, *values, extra, self._segment_hash(transcript_id, values, extra)))
+        return rows
+    
+    def _insert_segments(self, cursor: sqlite3.Cursor, rows: List[Tuple]):
+        """Insert rows built by _segment_rows into the segments table"""
+        cursor.executemany(
+            '''
+            INSERT INTO segments (
+                transcript_id, segment_id, position, speaker, text,
+                start_time, end_time, confidence, extra, hash
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            rows
+        )
+    
+    def _migrate_segments(self, cursor: sqlite3.Cursor):
+        """Move segments of transcripts stored as a single JSON document into the segments table"""
+        cursor.execute(
+            '''
+            SELECT id, data, hash FROM transcripts
+            WHERE NOT EXISTS (SELECT 1 FROM segments WHERE segments.transcript_id = transcripts.id)
+            '''
+        )
+        for transcript_id, json_data, stored_hash in cursor.fetchall():
+            if isinstance(json_data, str):
+                json_data = json_data.encode()
+            
+            data = orjson.loads(json_data)
+            if not data.get("segments"):
+                continue
+            
+            # Never re-hash data that no longer matches its original hash
+            if not self._hash_matches(json_data, stored_hash):
+                self.logger.error(f"Integrity check failed for transcript {transcript_id}, segments not migrated")
+                continue
+            
+            try:
+                segment_rows = self._segment_rows(transcript_id, data["segments"])
+            except ValueError as e:
+                self.logger.error(f"Segments of transcript {transcript_id} not migrated: {str(e)}")
+                continue
+            
+            self._insert_segments(cursor, segment_rows)
+            data["segments"] = []
+            json_data = orjson.dumps(data)
+            cursor.execute(
+                "UPDATE transcripts SET data = ?, hash = ? WHERE id = ?",
+                (json_data, hashlib.sha256(json_data).digest(), transcript_id)
+            )
+            self.logger.info(f"Migrated segments of transcript {transcript_id}")
+    
+    def _summarize(self, transcript_data: Dict) -> Tuple[int, int, float]:
+        """
+        Compute the summary fields shown in transcript listings
+        
+        Args:
+            transcript_data: Transcript data
+            
+        Returns:
+            Segment count, distinct speaker count and duration in seconds
+        """
+        segments = transcript_data.get("segments") or []
+        if not segments:
+            return 0, 0, 0
+        
+        speakers = {s.get("speaker") for s in segments}
+        return len(segments), len(speakers), segments[-1].get("end_time", 0)
+    
+    @contextlib.contextmanager
+    def _reader(self):
+        """
+        Borrow a read-only connection from the pool
+        
+        Yields:
+            Cursor on a read-only connection
+        """
+        if self._read_pool is None:
+            raise RuntimeError("Database is not initialized")
+        
+        conn = self._read_pool.get()
+        try:
+            yield conn.cursor()
+        finally:
+            self._read_pool.put(conn)
+    
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Run a block as one write transaction on the shared connection
+        
+        BEGIN IMMEDIATE takes the write lock up front, so the transaction
+        cannot fail halfway with SQLITE_BUSY when upgrading from a read.
+        
+        Yields:
+            Cursor on the read-write connection
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+    
+    def _add_column(self, cursor: sqlite3.Cursor, table: str, column_def: str):
+        """Add a column to an existing table, ignoring it if already present"""
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
+        except sqlite3.OperationalError:
+            pass
+    
+    def store_transcript(
+        self, transcript_id: str, transcript_data: Dict, content_hash: Optional[str] = None
+    ) -> bool:
         """
         Securely store a transcript
         
         Args:
             transcript_id: Unique identifier for the transcript
-            transcript_data: Transcript data to store
+            transcript_data: Transcript data to store; every segment needs a unique "id"
+            content_hash: Optional SHA-256 of the source audio, used for deduplication
             
         Returns:
             Success status
         """
         try:
-            # Convert data to JSON
-            json_data = json.dumps(transcript_data)
-            
-            # Generate hash for integrity verification
-            data_hash = hashlib.sha256(json_data.encode()).hexdigest()
+            self._write_transcripts([(transcript_id, transcript_data, content_hash)])
             
-            # Current timestamp
-            timestamp = datetime.now().isoformat()
+            self.logger.info(f"Stored transcript {transcript_id} successfully")
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error storing transcript: {str(e)}")
+            return False
+    
+    def store_transcripts_bulk(self, items: List[Tuple[str, Dict, Optional[str]]]) -> bool:
+        """
+        Store many transcripts in a single transaction, e.g. for imports
+        
+        Args:
+            items: (transcript_id, transcript_data, content_hash) tuples
             
-            # Store in database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+        Returns:
+            Success status; on failure none of the transcripts are stored
+        """
+        try:
+            items = list(items)
+            self._write_transcripts(items)
             
-            cursor.execute(
+            self.logger.info(f"Stored {len(items)} transcripts successfully")
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error storing transcripts: {str(e)}")
+            return False
+    
+    def _write_transcripts(self, items: List[Tuple[str, Dict, Optional[str]]]):
+        """
+        Insert transcripts, their segments and audit entries with one statement per table
+        
+        Args:
+            items: (transcript_id, transcript_data, content_hash) tuples
+        """
+        # Current timestamp
+        timestamp = datetime.now().isoformat()
+        
+        transcript_rows, segment_rows, audit_rows = [], [], []
+        for transcript_id, transcript_data, content_hash in items:
+            # Segments go to their own table; the document keeps an empty
+            # list in their place so the key order survives a round trip
+            segments = transcript_data.get("segments") or []
+            document = dict(transcript_data)
+            if "segments" in document:
+                document["segments"] = []
+            
+            # Serialize straight to UTF-8 JSON bytes, stored as a BLOB
+            json_data = orjson.dumps(document)
+            
+            # Generate hash for integrity verification, stored as the raw 32-byte digest
+            data_hash = hashlib.sha256(json_data).digest()
+            
+            transcript_rows.append((
+                transcript_id,
+                json_data,
+                timestamp,
+                timestamp,
+                (transcript_data.get("case_details") or {}).get("case_id"),
+                data_hash,
+                content_hash,
+                *self._summarize(transcript_data)
+            ))
+            segment_rows.extend(self._segment_rows(transcript_id, segments))
+            audit_rows.append((
+                str(uuid.uuid4()),
+                transcript_id,
+                "create",
+                "system",
+                timestamp,
+                f"Created transcript with {len(segments)} segments"
+            ))
+        
+        # Store in database
+        with self._transaction() as cursor:
+            cursor.executemany(
                 '''
-                INSERT INTO transcripts (id, data, created_at, updated_at, case_id, hash)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ''',
-                (
-                    transcript_id,
-                    json_data,
-                    timestamp,
-                    timestamp,
-                    transcript_data.get("case_details", {}).get("case_id"),
-                    data_hash
+                INSERT INTO transcripts (
+                    id, data, created_at, updated_at, case_id, hash, content_hash,
+                    segments_count, speakers_count, duration
                 )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''',
+                transcript_rows
             )
+            self._insert_segments(cursor, segment_rows)
             
-            # Log the action
-            log_id = str(uuid.uuid4())
-            cursor.execute(
+            # Log the actions
+            cursor.executemany(
                 '''
                 INSERT INTO audit_log (id, transcript_id, action, user, timestamp, details)
                 VALUES (?, ?, ?, ?, ?, ?)
                 ''',
-                (
-                    log_id,
-                    transcript_id,
-                    "create",
-                    "system",
-                    timestamp,
-                    f"Created transcript with {len(transcript_data.get('segments', []))} segments"
-                )
+                audit_rows
             )
-            
-            conn.commit()
-            conn.close()
-            
-            self.logger.info(f"Stored transcript {transcript_id} successfully")
-            return True
         
-        except Exception as e:
-            self.logger.error(f"Error storing transcript: {str(e)}")
-            return False
+        for transcript_id, _, _ in items:
+            self._invalidate(transcript_id)
     
     def get_transcript(self, transcript_id: str) -> Optional[Dict]:
         """
         Retrieve a transcript by ID
         
+        Verified transcripts are cached, so callers must not modify the returned dict
+        
         Args:
             transcript_id: The ID of the transcript to retrieve
             
@@ -132,28 +522,82 @@ class StorageService:
             Transcript data or None if not found
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            # Look up the row version first; it is enough to validate a cached copy.
+            # Segment edits leave the document hash alone but bump updated_at
+            with self._reader() as cursor:
+                cursor.execute("SELECT hash, updated_at FROM transcripts WHERE id = ?", (transcript_id,))
+                result = cursor.fetchone()
             
-            cursor.execute(
-                "SELECT data, hash FROM transcripts WHERE id = ?",
-                (transcript_id,)
-            )
+            if result is None:
+                return None
             
-            result = cursor.fetchone()
-            conn.close()
+            with self._cache_lock:
+                cached = self._cache.get(transcript_id)
+            if cached and cached[0] == result:
+                return cached[1]
+            
+            # Read the document and its segments from one snapshot
+            with self._reader() as cursor:
+                cursor.execute("BEGIN")
+                try:
+                    cursor.execute(
+                        "SELECT data, hash, updated_at FROM transcripts WHERE id = ?",
+                        (transcript_id,)
+                    )
+                    result = cursor.fetchone()
+                    
+                    cursor.execute(
+                        '''
+                        SELECT segment_id, position, speaker, text, start_time, end_time, confidence, extra, hash
+                        FROM segments
+                        WHERE transcript_id = ?
+                        ORDER BY position
+                        ''',
+                        (transcript_id,)
+                    )
+                    segment_rows = cursor.fetchall()
+                finally:
+                    cursor.execute("COMMIT")
             
             if result:
-                json_data, stored_hash = result
+                json_data, stored_hash, updated_at = result
                 
-                # Verify integrity
-                computed_hash = hashlib.sha256(json_data.encode()).hexdigest()
-                if computed_hash != stored_hash:
+                # Rows written before the switch to BLOB storage hold text
+                if isinstance(json_data, str):
+                    json_data = json_data.encode()
+                
+                # Verify integrity of the document and of every segment row
+                if not self._hash_matches(json_data, stored_hash):
                     self.logger.error(f"Integrity check failed for transcript {transcript_id}")
                     return None
                 
-                # Parse and return the data
-                return json.loads(json_data)
+                for row in segment_rows:
+                    if self._segment_hash(transcript_id, row[:-2], row[-2]) != row[-1]:
+                        self.logger.error(f"Integrity check failed for segment {row[0]} of transcript {transcript_id}")
+                        return None
+                
+                # Parse the data and put the segments back in place; documents
+                # whose segments could not be migrated still hold them inline
+                data = orjson.loads(json_data)
+                if "segments" in data and not data["segments"]:
+                    data["segments"] = [
+                        {
+                            "id": segment_id,
+                            "speaker": speaker,
+                            "text": text,
+                            "start_time": start_time,
+                            "end_time": end_time,
+                            "confidence": confidence,
+                            **(orjson.loads(extra) if extra else {})
+                        }
+                        for segment_id, _, speaker, text, start_time, end_time, confidence, extra, _ in segment_rows
+                    ]
+                
+                # Cache it under the verified row version
+                with self._cache_lock:
+                    self._cache[transcript_id] = ((stored_hash, updated_at), data)
+                
+                return data
             
             return None
         
@@ -161,6 +605,33 @@ class StorageService:
             self.logger.error(f"Error retrieving transcript: {str(e)}")
             return None
     
+    def get_by_content_hash(self, content_hash: str, case_id: Optional[str] = None) -> Optional[str]:
+        """
+        Find a transcript previously produced from identical audio
+        
+        Args:
+            content_hash: SHA-256 of the source audio
+            case_id: Case the audio was uploaded for
+            
+        Returns:
+            ID of the matching transcript or None if not found
+        """
+        try:
+            with self._reader() as cursor:
+                
+                cursor.execute(
+                    "SELECT id FROM transcripts WHERE content_hash = ? AND case_id IS ? LIMIT 1",
+                    (content_hash, case_id)
+                )
+                
+                result = cursor.fetchone()
+            
+            return result[0] if result else None
+        
+        except Exception as e:
+            self.logger.error(f"Error looking up transcript by content hash: {str(e)}")
+            return None
+    
     def update_transcript_segment(
         self, transcript_id: str, segment_id: str, new_text: str, user: str
     ) -> bool:
@@ -177,66 +648,52 @@ class StorageService:
             Success status
         """
         try:
-            # Get the current transcript
-            transcript = self.get_transcript(transcript_id)
-            if not transcript:
-                self.logger.error(f"Transcript {transcript_id} not found")
-                return False
-            
-            # Find and update the segment
-            segment_updated = False
-            for segment in transcript.get("segments", []):
-                if segment.get("id") == segment_id:
-                    segment["text"] = new_text
-                    segment_updated = True
-                    break
-            
-            if not segment_updated:
-                self.logger.error(f"Segment {segment_id} not found in transcript {transcript_id}")
-                return False
-            
-            # Convert updated data to JSON
-            json_data = json.dumps(transcript)
-            
-            # Generate new hash
-            data_hash = hashlib.sha256(json_data.encode()).hexdigest()
-            
             # Current timestamp
             timestamp = datetime.now().isoformat()
             
-            # Update in database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                '''
-                UPDATE transcripts 
-                SET data = ?, updated_at = ?, hash = ?
-                WHERE id = ?
-                ''',
-                (json_data, timestamp, data_hash, transcript_id)
-            )
-            
-            # Log the action
-            log_id = str(uuid.uuid4())
-            cursor.execute(
-                '''
-                INSERT INTO audit_log (id, transcript_id, action, user, timestamp, details)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ''',
-                (
-                    log_id,
-                    transcript_id,
-                    "update_segment",
-                    user,
-                    timestamp,
-                    f"Updated segment {segment_id}"
+            # Update the single segment row in the database
+            with self._transaction() as cursor:
+                # Set the text and re-hash the row in a single statement, without
+                # reading the row back into Python first
+                cursor.execute(
+                    '''
+                    UPDATE segments
+                    SET text = ?1,
+                        hash = segment_hash(
+                            transcript_id, segment_id, position, speaker, ?1,
+                            start_time, end_time, confidence, extra
+                        )
+                    WHERE transcript_id = ?2 AND segment_id = ?3
+                    ''',
+                    (new_text, transcript_id, segment_id)
+                )
+                if cursor.rowcount == 0:
+                    self.logger.error(f"Segment {segment_id} not found in transcript {transcript_id}")
+                    return False
+                
+                cursor.execute(
+                    "UPDATE transcripts SET updated_at = ? WHERE id = ?",
+                    (timestamp, transcript_id)
+                )
+                
+                # Log the action
+                log_id = str(uuid.uuid4())
+                cursor.execute(
+                    '''
+                    INSERT INTO audit_log (id, transcript_id, action, user, timestamp, details)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ''',
+                    (
+                        log_id,
+                        transcript_id,
+                        "update_segment",
+                        user,
+                        timestamp,
+                        f"Updated segment {segment_id}"
+                    )
                 )
-            )
-            
-            conn.commit()
-            conn.close()
             
+            self._invalidate(transcript_id)
             self.logger.info(f"Updated segment {segment_id} in transcript {transcript_id}")
             return True
         
@@ -256,40 +713,36 @@ class StorageService:
             Success status
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if transcript exists
-            cursor.execute("SELECT id FROM transcripts WHERE id = ?", (transcript_id,))
-            if cursor.fetchone() is None:
-                conn.close()
-                self.logger.error(f"Transcript {transcript_id} not found")
-                return False
-            
-            # Log the deletion first for audit purposes
-            timestamp = datetime.now().isoformat()
-            log_id = str(uuid.uuid4())
-            cursor.execute(
-                '''
-                INSERT INTO audit_log (id, transcript_id, action, user, timestamp, details)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ''',
-                (
-                    log_id,
-                    transcript_id,
-                    "delete",
-                    user,
-                    timestamp,
-                    "Transcript deleted"
+            with self._transaction() as cursor:
+                # Check if transcript exists
+                cursor.execute("SELECT id FROM transcripts WHERE id = ?", (transcript_id,))
+                if cursor.fetchone() is None:
+                    self.logger.error(f"Transcript {transcript_id} not found")
+                    return False
+                
+                # Log the deletion first for audit purposes
+                timestamp = datetime.now().isoformat()
+                log_id = str(uuid.uuid4())
+                cursor.execute(
+                    '''
+                    INSERT INTO audit_log (id, transcript_id, action, user, timestamp, details)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ''',
+                    (
+                        log_id,
+                        transcript_id,
+                        "delete",
+                        user,
+                        timestamp,
+                        "Transcript deleted"
+                    )
                 )
-            )
-            
-            # Delete the transcript
-            cursor.execute("DELETE FROM transcripts WHERE id = ?", (transcript_id,))
-            
-            conn.commit()
-            conn.close()
+                
+                # Delete the transcript and its segments
+                cursor.execute("DELETE FROM segments WHERE transcript_id = ?", (transcript_id,))
+                cursor.execute("DELETE FROM transcripts WHERE id = ?", (transcript_id,))
             
+            self._invalidate(transcript_id)
             self.logger.info(f"Deleted transcript {transcript_id}")
             return True
         
@@ -313,11 +766,20 @@ class StorageService:
             List of transcript summaries
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            # Transcript data is only needed for the judge/admin details. With
+            # JSON1 available, SQLite extracts just the two fields required
+            include_details = user_role in ["judge", "admin"]
+            extract_details = self.json1_available
+            details_columns = ""
+            if include_details:
+                details_columns = (
+                    ", json_extract(CAST(data AS TEXT), '$.metadata'), json_extract(CAST(data AS TEXT), '$.case_details')"
+                    if extract_details else ", data"
+                )
             
-            query = '''
-                SELECT id, data, created_at, updated_at, case_id
+            query = f'''
+                SELECT id, created_at, updated_at, case_id,
+                       segments_count, speakers_count, duration{details_columns}
                 FROM transcripts
             '''
             
@@ -329,14 +791,13 @@ class StorageService:
             query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
             params.extend([limit, offset])
             
-            cursor.execute(query, params)
+            with self._reader() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
             
             results = []
-            for row in cursor.fetchall():
-                transcript_id, json_data, created_at, updated_at, case_id = row
-                
-                # Parse data to extract summary
-                data = json.loads(json_data)
+            for row in rows:
+                transcript_id, created_at, updated_at, case_id, segments_count, speakers_count, duration = row[:7]
                 
                 # Create a summary based on user role
                 summary = {
@@ -344,26 +805,65 @@ class StorageService:
                     "created_at": created_at,
                     "updated_at": updated_at,
                     "case_id": case_id,
-                    "segments_count": len(data.get("segments", [])),
-                    "speakers_count": len(set([s.get("speaker") for s in data.get("segments", [])])) if data.get("segments") else 0,
-                    "duration": data.get("segments", [])[-1].get("end_time", 0) if data.get("segments") else 0
+                    "segments_count": segments_count,
+                    "speakers_count": speakers_count,
+                    "duration": duration
                 }
                 
                 # Include more details for judges and admins
-                if user_role in ["judge", "admin"]:
-                    summary["metadata"] = data.get("metadata", {})
-                    if data.get("case_details"):
-                        summary["case_details"] = data.get("case_details")
+                if include_details:
+                    if extract_details:
+                        metadata, case_details = (orjson.loads(v) if v else None for v in row[7:9])
+                    else:
+                        data = orjson.loads(row[7])
+                        metadata, case_details = data.get("metadata"), data.get("case_details")
+                    
+                    summary["metadata"] = metadata or {}
+                    if case_details:
+                        summary["case_details"] = case_details
                 
                 results.append(summary)
             
-            conn.close()
             return results
         
         except Exception as e:
             self.logger.error(f"Error listing transcripts: {str(e)}")
             return []
     
+    def _iter_txt_export(self, transcript_id: str, transcript: Dict):
+        """
+        Generate the plain-text export of a transcript as UTF-8 chunks
+        
+        Args:
+            transcript_id: The ID of the transcript
+            transcript: Transcript data
+            
+        Yields:
+            Encoded header lines, then one chunk per segment
+        """
+        # Header
+        case_details = transcript.get("case_details") or {}
+        header = f"TRANSCRIPT ID: {transcript_id}\n"
+        header += f"Date: {transcript.get('metadata', {}).get('created_at', 'Unknown')}\n"
+        if case_details:
+            header += f"Case: {case_details.get('case_title', 'Unknown')}\n"
+            header += f"Court: {case_details.get('court', 'Unknown')}\n"
+            header += f"Judge: {case_details.get('judge', 'Unknown')}\n"
+        header += "\n" + "=" * 80 + "\n\n"
+        yield header.encode("utf-8")
+        
+        # Segments; the speaker is only printed when it changes
+        current_speaker = None
+        for segment in transcript.get("segments", []):
+            start_time = segment.get("start_time") or 0
+            timestamp = f"[{int(start_time // 60):02d}:{int(start_time % 60):02d}]"
+            
+            speaker = segment.get("speaker")
+            prefix = f"\n\n{speaker}: " if speaker != current_speaker else ""
+            current_speaker = speaker
+            
+            yield f"{prefix}{segment.get('text', '')} {timestamp} ".encode("utf-8")
+    
     def export_transcript(self, transcript_id: str, format: str = "pdf") -> Optional[str]:
         """
         Export a transcript in various formats
@@ -387,33 +887,9 @@ class StorageService:
                 export_path = temp_file.name
             
             if format == "txt":
-                # Simple text export
-                with open(export_path, "w", encoding="utf-8") as f:
-                    # Write header
-                    f.write(f"TRANSCRIPT ID: {transcript_id}\n")
-                    f.write(f"Date: {transcript.get('metadata', {}).get('created_at', 'Unknown')}\n")
-                    if transcript.get("case_details"):
-                        f.write(f"Case: {transcript.get('case_details', {}).get('case_title', 'Unknown')}\n")
-                        f.write(f"Court: {transcript.get('case_details', {}).get('court', 'Unknown')}\n")
-                        f.write(f"Judge: {transcript.get('case_details', {}).get('judge', 'Unknown')}\n")
-                    
-                    f.write("\n" + "="*80 + "\n\n")
-                    
-                    # Write segments
-                    current_speaker = None
-                    for segment in transcript.get("segments", []):
-                        # Format timestamp
-                        start_time = segment.get("start_time", 0)
-                        start_mins = int(start_time // 60)
-                        start_secs = int(start_time % 60)
-                        timestamp = f"[{start_mins:02d}:{start_secs:02d}]"
-                        
-                        # Only print speaker when it changes
-                        if segment.get("speaker") != current_speaker:
-                            current_speaker = segment.get("speaker")
-                            f.write(f"\n\n{current_speaker}: ")
-                        
-                        f.write(f"{segment.get('text', '')} {timestamp} ")
+                # Simple text export, written as pre-encoded chunks in one call
+                with open(export_path, "wb") as f:
+                    f.writelines(self._iter_txt_export(transcript_id, transcript))
             
             elif format == "pdf":
                 # For demo purposes, we'll just create a dummy PDF file
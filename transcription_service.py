@@ -1,8 +1,8 @@
 import os
 import time
 import uuid
+import math
 import numpy as np
-import whisper
 import torch
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
@@ -12,6 +12,19 @@ from diarization_service import DiarizationService
 from storage_service import StorageService
 from utils import create_logger
 
+# Prefer the CTranslate2 Whisper implementation, fall back to openai-whisper
+try:
+    from faster_whisper import WhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+try:
+    import whisper
+    WHISPER_AVAILABLE = True
+except ImportError:
+    WHISPER_AVAILABLE = False
+
 class CourtTranscriptionService:
     def __init__(
         self, 
@@ -28,28 +41,108 @@ class CourtTranscriptionService:
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.logger.info(f"Using device: {self.device}")
         
+        # openai-whisper runs in half precision on CUDA; CPU stays in FP32
+        self.use_fp16 = self.device.type == "cuda"
+        
         # Load base model for better performance on limited hardware
         # In a production environment with more resources, use the medium or large model
+        if not FASTER_WHISPER_AVAILABLE and not WHISPER_AVAILABLE:
+            raise RuntimeError("Neither faster-whisper nor openai-whisper is installed")
+        
         try:
-            self.model = whisper.load_model("base").to(self.device)
-            self.logger.info("Whisper base model loaded successfully")
+            self.model = self._load_model("base")
+            self.logger.info(f"{self.model_name} model loaded successfully")
         except Exception as e:
             self.logger.error(f"Error loading Whisper model: {str(e)}")
             self.logger.info("Attempting to load tiny model as fallback")
             try:
-                self.model = whisper.load_model("tiny").to(self.device)
-                self.logger.info("Whisper tiny model loaded successfully")
+                self.model = self._load_model("tiny")
+                self.logger.info(f"{self.model_name} model loaded successfully")
             except Exception as e2:
                 self.logger.error(f"Error loading fallback model: {str(e2)}")
                 raise RuntimeError("Failed to initialize Whisper model")
         
-    def process_audio(self, audio_file: str, case_id: Optional[str] = None) -> Dict:
+    def _load_model(self, size: str):
+        """
+        Load a Whisper model, preferring faster-whisper when installed
+        
+        faster-whisper runs FP16 on CUDA and INT8 on CPU.
+        
+        Args:
+            size: Whisper model size (e.g. "base", "tiny")
+            
+        Returns:
+            Loaded model
+        """
+        if FASTER_WHISPER_AVAILABLE:
+            compute_type = "float16" if self.device.type == "cuda" else "int8"
+            model = WhisperModel(size, device=self.device.type, compute_type=compute_type)
+            self.model_name = f"faster-whisper-{size}-{compute_type}"
+            return model
+        
+        # Half-precision weights halve the model's VRAM on CUDA
+        model = whisper.load_model(size).to(self.device)
+        if self.use_fp16:
+            model = model.half()
+        self.model_size = size
+        self.model_name = f"whisper-{size}"
+        return model
+    
+    def _transcribe(self, audio_file: str) -> List[Dict]:
+        """
+        Run speech recognition on an audio file
+        
+        Args:
+            audio_file: Path to the audio file
+            
+        Returns:
+            Segments with start, end and text (and confidence with faster-whisper)
+        """
+        if FASTER_WHISPER_AVAILABLE:
+            # Segments are decoded lazily; VAD skips silent stretches entirely
+            segments, _ = self.model.transcribe(audio_file, vad_filter=True)
+            return [
+                {
+                    "start": segment.start,
+                    "end": segment.end,
+                    "text": segment.text,
+                    "confidence": math.exp(segment.avg_logprob)
+                }
+                for segment in segments
+            ]
+        
+        # Decode to 16 kHz mono once up front. Not conditioning on the previous
+        # window stops hallucination loops that re-decode the same stretch
+        audio = whisper.load_audio(audio_file)
+        options = {"condition_on_previous_text": False, "no_speech_threshold": 0.6}
+        
+        if self.use_fp16:
+            try:
+                with torch.inference_mode():
+                    return self.model.transcribe(audio, fp16=True, **options)["segments"]
+            except torch.cuda.OutOfMemoryError:
+                # Running out of memory is not a precision problem
+                raise
+            except RuntimeError as e:
+                # Swap in an FP32 copy once and stay in FP32 from now on. Jobs
+                # run one at a time, so no other decode is using the model
+                self.logger.warning(f"FP16 decoding failed, falling back to FP32: {str(e)}")
+                self.model = whisper.load_model(self.model_size).to(self.device)
+                self.use_fp16 = False
+        
+        with torch.inference_mode():
+            return self.model.transcribe(audio, fp16=False, **options)["segments"]
+    
+    def process_audio(
+        self, audio_file: str, case_id: Optional[str] = None, content_hash: Optional[str] = None
+    ) -> Dict:
         """
         Process audio file with noise suppression, speech recognition, and speaker diarization
         
         Args:
             audio_file: Path to the audio file
             case_id: Optional case identifier
+            content_hash: Optional SHA-256 of the audio file, stored for deduplication
             
         Returns:
             Dictionary containing transcript information
@@ -79,8 +172,7 @@ class CourtTranscriptionService:
         # Run speech recognition with Whisper
         transcription_start = time.time()
         try:
-            result = self.model.transcribe(clean_audio_file)
-            transcribed_segments = result["segments"]
+            transcribed_segments = self._transcribe(clean_audio_file)
             self.logger.info(f"Speech recognition completed in {time.time() - transcription_start:.2f} seconds")
         except Exception as e:
             self.logger.error(f"Error in speech recognition: {str(e)}")
@@ -95,11 +187,12 @@ class CourtTranscriptionService:
         transcript_id = str(uuid.uuid4())
         
         # Prepare metadata
+        now = datetime.now()
         metadata = {
-            "created_at": datetime.now().isoformat(),
+            "created_at": now.isoformat(),
             "audio_file": os.path.basename(audio_file),
             "processing_time": time.time() - start_time,
-            "model": f"whisper-{self.model.name}",
+            "model": self.model_name,
             "device": str(self.device),
             "speakers_detected": len(set([s["speaker"] for s in speaker_segments])) if speaker_segments else 0,
             "case_id": case_id
@@ -110,12 +203,12 @@ class CourtTranscriptionService:
             "id": transcript_id,
             "segments": combined_segments,
             "metadata": metadata,
-            "case_details": self._get_case_details(case_id) if case_id else None,
+            "case_details": self._get_case_details(case_id, now) if case_id else None,
             "status": "success"
         }
         
         try:
-            self.storage_service.store_transcript(transcript_id, transcript)
+            self.storage_service.store_transcript(transcript_id, transcript, content_hash)
         except Exception as e:
             self.logger.error(f"Error storing transcript: {str(e)}")
             # Continue anyway since we can return the transcript directly
@@ -138,38 +231,121 @@ class CourtTranscriptionService:
         Returns:
             Combined segments with speaker information
         """
-        combined_segments = []
+        # Read each field out of the segment dicts once
+        spans = [(segment["start"], segment["end"]) for segment in transcribed_segments]
+        turns = [(turn["start"], turn["end"], turn["speaker"]) for turn in speaker_segments]
+        
+        # Both lists normally come out of their models in time order, which
+        # allows a linear sweep; otherwise fall back to the overlap matrix
+        if not spans or not turns:
+            best_speakers = ["Unknown"] * len(spans)
+        elif self._is_time_ordered(spans) and self._is_time_ordered(turns):
+            best_speakers = self._match_speakers_sweep(spans, turns)
+        else:
+            best_speakers = self._match_speakers_matrix(spans, turns)
+        
+        # Random (version 4) segment IDs from a single entropy read rather
+        # than one uuid4() call per segment
+        random_bytes = os.urandom(16 * len(spans))
+        segment_ids = [
+            str(uuid.UUID(bytes=random_bytes[i:i + 16], version=4))
+            for i in range(0, len(random_bytes), 16)
+        ]
+        
+        return [
+            {
+                "id": segment_id,
+                "speaker": best_speaker,
+                "text": segment["text"],
+                "start_time": start,
+                "end_time": end,
+                "confidence": float(segment.get("confidence", 0.0))
+            }
+            for segment, (start, end), best_speaker, segment_id
+            in zip(transcribed_segments, spans, best_speakers, segment_ids)
+        ]
+    
+    def _is_time_ordered(self, intervals: List[Tuple]) -> bool:
+        """Check whether (start, end, ...) tuples are sorted by start time"""
+        return all(a[0] <= b[0] for a, b in zip(intervals, intervals[1:]))
+    
+    def _match_speakers_sweep(
+        self,
+        spans: List[Tuple[float, float]],
+        turns: List[Tuple[float, float, str]]
+    ) -> List[str]:
+        """
+        Find the speaker with the most overlap for each segment in one pass
+        
+        Both lists must be sorted by start time. Runs in O(N + M) for
+        non-overlapping speaker turns.
+        
+        Args:
+            spans: (start, end) of each transcribed segment
+            turns: (start, end, speaker) of each diarization turn
+            
+        Returns:
+            Speaker label per transcribed segment
+        """
+        best_speakers = []
+        j = 0
+        num_turns = len(turns)
         
-        for segment in transcribed_segments:
-            segment_start = segment["start"]
-            segment_end = segment["end"]
+        for segment_start, segment_end in spans:
+            # Turns ending before this segment cannot overlap any later one either
+            while j < num_turns and turns[j][1] <= segment_start:
+                j += 1
             
-            # Find speaker with the most overlap
+            # Find speaker with the most overlap among turns starting before the segment ends
             best_speaker = "Unknown"
             max_overlap = 0
             
-            for spk_segment in speaker_segments:
-                overlap_start = max(segment_start, spk_segment["start"])
-                overlap_end = min(segment_end, spk_segment["end"])
-                overlap = max(0, overlap_end - overlap_start)
-                
+            k = j
+            while k < num_turns and turns[k][0] < segment_end:
+                turn_start, turn_end, speaker = turns[k]
+                overlap = min(segment_end, turn_end) - max(segment_start, turn_start)
                 if overlap > max_overlap:
                     max_overlap = overlap
-                    best_speaker = spk_segment["speaker"]
+                    best_speaker = speaker
+                k += 1
             
-            # Add to combined segments
-            combined_segments.append({
-                "id": str(uuid.uuid4()),
-                "speaker": best_speaker,
-                "text": segment["text"],
-                "start_time": segment_start,
-                "end_time": segment_end,
-                "confidence": float(segment.get("confidence", 0.0))
-            })
+            best_speakers.append(best_speaker)
+        
+        return best_speakers
+    
+    def _match_speakers_matrix(
+        self,
+        spans: List[Tuple[float, float]],
+        turns: List[Tuple[float, float, str]]
+    ) -> List[str]:
+        """
+        Find the speaker with the most overlap for each segment, in any order
+        
+        Args:
+            spans: (start, end) of each transcribed segment
+            turns: (start, end, speaker) of each diarization turn
+            
+        Returns:
+            Speaker label per transcribed segment
+        """
+        # Overlap of every transcribed segment with every speaker turn, computed
+        # as one (segments x turns) matrix instead of a Python double loop
+        ts = np.array(spans, dtype=np.float64)
+        sp = np.array([(start, end) for start, end, _ in turns], dtype=np.float64)
+        overlap = np.clip(
+            np.minimum(ts[:, None, 1], sp[None, :, 1]) - np.maximum(ts[:, None, 0], sp[None, :, 0]),
+            0, None
+        )
         
-        return combined_segments
+        # argmax keeps the first turn on ties; no positive overlap means no speaker
+        best = overlap.argmax(axis=1)
+        has_overlap = overlap[np.arange(len(ts)), best] > 0
+        return [
+            turns[j][2] if hit else "Unknown"
+            for j, hit in zip(best.tolist(), has_overlap.tolist())
+        ]
     
-    def _get_case_details(self, case_id: str) -> Dict:
+    def _get_case_details(self, case_id: str, now: Optional[datetime] = None) -> Dict:
         """
         Get case details from a hypothetical case management system
         
@@ -181,5 +357,5 @@ class CourtTranscriptionService:
             "case_title": f"Case #{case_id}",
             "court": "District Court",
             "judge": "Hon. Judge Smith",
-            "date": datetime.now().strftime("%Y-%m-%d")
+            "date": (now or datetime.now()).strftime("%Y-%m-%d")
         }
\ No newline at end of file
@@ -1,11 +1,28 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import platform
+import re
 from datetime import datetime
 
+# Background listeners writing queued log records, stopped (and flushed) at exit
+_log_listeners = []
+
+@atexit.register
+def _stop_log_listeners():
+    """Flush and stop all log listeners"""
+    for listener in _log_listeners:
+        listener.stop()
+
 def create_logger(name: str) -> logging.Logger:
     """
     Create a logger with the given name
     
+    Records are handed to a background thread through a queue, so logging
+    never blocks the caller on console or file I/O.
+    
     Args:
         name: Logger name
     
@@ -33,14 +50,20 @@ def create_logger(name: str) -> logging.Logger:
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
     
-    # Create file handler
-    file_handler = logging.FileHandler(f"logs/{name}.log")
+    # Create file handler; the file is opened on the first record
+    file_handler = logging.FileHandler(f"logs/{name}.log", delay=True)
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(formatter)
     
-    # Add handlers to logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # The logger only enqueues; a listener thread runs the real handlers
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    listener.start()
+    _log_listeners.append(listener)
+    
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
     
     return logger
 
@@ -51,4 +74,24 @@ def generate_timestamp() -> str:
     Returns:
         Current timestamp string
     """
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
\ No newline at end of file
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def kernel_version_at_least(major: int, minor: int) -> bool:
+    """
+    Check whether the process runs on a Linux kernel of at least the given version
+    
+    Args:
+        major: Required major version
+        minor: Required minor version
+    
+    Returns:
+        True on Linux with a recent enough kernel, False otherwise
+    """
+    if platform.system() != "Linux":
+        return False
+    
+    match = re.match(r"(\d+)\.(\d+)", platform.release())
+    if not match:
+        return False
+    
+    return (int(match.group(1)), int(match.group(2))) >= (major, minor)
\ No newline at end of file